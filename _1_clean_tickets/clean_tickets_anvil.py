@@ -14,8 +14,10 @@ from cluster_selection import find_top_tickets
 import warnings
 import os
 import sys
+import re
+import html
+import string
 import clean_tickets_tdx as cln_tkts
-from markdownify import markdownify as md
 
 
 warnings.simplefilter(action='ignore', category=Warning)
@@ -24,42 +26,93 @@ warnings.simplefilter(action='ignore', category=Warning)
 # Resulting data destination
 dd = os.path.join(r"_1_clean_tickets\init_anvil_cln_tkts.csv")
 
+# HTML tags occasionally embedded in Jira messages (block-level tags and line breaks become new lines)
+_HTML_BREAK = re.compile(r'<(?:br|/?(?:p|div|li|ul|ol|tr|table|h[1-6]))\b[^>]*>', re.IGNORECASE)
+_HTML_TAG = re.compile(r'</?[a-z][^>]*>', re.IGNORECASE)
 
-def strip_jira_formatting(df: pd.DataFrame) -> pd.DataFrame:
+# Jira formatting patterns
+_JIRA_NEWLINES = re.compile(r'\n+')
+_JIRA_LINK_PIPE = re.compile(r'\[(.*?)\|(.*?)\]', re.IGNORECASE)
+_JIRA_LINK = re.compile(r'\[(.*?)\]', re.IGNORECASE)
+_JIRA_ADF = re.compile(r'\{adf.*?\}.*?\{adf\}', re.IGNORECASE)
+_JIRA_FORMAT = re.compile(r'\{(color|quote|code|noformat).*?\}', re.IGNORECASE)
+_JIRA_ATTACHMENT = re.compile(r'\!.*?\..{2,4}(?:|[a-z \,\=\d]+?)?\!', re.IGNORECASE)
+_JIRA_WHITESPACE = re.compile(r'\s+', re.IGNORECASE)
+
+# Characters trimmed from both ends of a message
+_QUOTES_AND_WHITESPACE = '"' + string.whitespace
 
-    # Remove tickets with no content
-    df = df[~df['customernote'].fillna('').str.match(r'^\s*$')]
 
-    # Change to markdown for easier parsing
-    df['customernote'] = df['customernote'].apply(md)
+# Strip Jira markup and misc elements from a single message that is already markdown
+def strip_jira_markup(note: str) -> str:
 
     # Revove new lines
-    df['customernote'] = df['customernote'].str.replace(r'\n+', ' ', regex=True)
+    note = _JIRA_NEWLINES.sub(' ', note)
 
     # Remove links [text|url] or [url]
-    df['customernote'] = df['customernote'].str.replace(r'\[(.*?)\|(.*?)\]', r'\1: \2', regex=True, case=False)
-    df['customernote'] = df['customernote'].str.replace(r'\[(.*?)\]', r'\1', regex=True, case=False)
+    note = _JIRA_LINK_PIPE.sub(r'\1: \2', note)
+    note = _JIRA_LINK.sub(r'\1', note)
 
     # Remove signitures
-    df['customernote'] = df['customernote'].str.replace(r'\{adf.*?\}.*?\{adf\}', '', regex=True, case=False) 
+    note = _JIRA_ADF.sub('', note)
 
     # Remove other formatting
-    df['customernote'] = df['customernote'].str.replace(r'\{(color|quote|code|noformat).*?\}', '', regex=True, case=False)
+    note = _JIRA_FORMAT.sub('', note)
 
     # Remove images/attachments
-    df['customernote'] = df['customernote'].str.replace(r'\!.*?\..{2,4}(?:|[a-z \,\=\d]+?)?\!', '', regex=True, case=False)
+    note = _JIRA_ATTACHMENT.sub('', note)
 
     # Remove extra whitespace
-    df['customernote'] = df['customernote'].str.replace(r'\s+', ' ', regex=True, case=False)
-    
+    note = _JIRA_WHITESPACE.sub(' ', note)
+
     # Remove misc elements
-    df['customernote'] = df['customernote'].replace(cln_tkts.remove_clutter(), regex=True)
+    note = cln_tkts.scrub_clutter(note)
 
     # Remove leading and ending whitespace
-    df['customernote'] = df['customernote'].str.replace(r'^[\"\s]*', '', regex=True)
-    df['customernote'] = df['customernote'].str.replace(r'[\"\s]*$', '', regex=True)
+    note = note.strip(_QUOTES_AND_WHITESPACE)
+
+    return note
+
+
+# Reduce any embedded HTML to plain text (most Jira messages contain none, so skip the regexes when there is no tag)
+def html_to_text(note: str) -> str:
+
+    if '<' in note:
+        note = _HTML_BREAK.sub('\n', note)
+        note = _HTML_TAG.sub('', note)
+
+    return html.unescape(note)
+
+
+# Strip Jira formatting from a single message
+def strip_jira_note(note: str) -> str:
+
+    note = html_to_text(note)
+
+    return cln_tkts.fixed_point(strip_jira_markup, note)
+
+
+# Fully clean a single message: formatting, names, and message separators
+def clean_jira_note(note: str) -> str:
+
+    note = strip_jira_note(note)
+    note = cln_tkts.anonymize_note(note)
+    note = cln_tkts.separate_messages(note)
+
+    # Name removal and separation can leave new clutter behind, so tidy up again (usually a single no-op check)
+    return cln_tkts.fixed_point(strip_jira_markup, note)
+
+
+# Clean every ticket in one pass per string instead of running the whole pipeline over the column twice
+def clean_jira_tickets(df: pd.DataFrame) -> pd.DataFrame:
+
+    # Remove tickets with no content
+    df = df[df['customernote'].fillna('').str.strip().ne('')]
+
+    cln_tkts.names_processor() # refresh the cache once before the workers read it
+    df['customernote'] = pd.Series(cln_tkts.parallel_map(clean_jira_note, df['customernote'].tolist()), index=df.index, dtype=cln_tkts.NOTE_DTYPE)
 
-    df = df[~df['customernote'].fillna('').str.match(r'^\s*$')]
+    df = df[df['customernote'].fillna('').str.strip().ne('')]
 
     return df
 
@@ -73,13 +126,11 @@ if __name__ == "__main__":
 
     #-------------------------- Initial Data Cleaning ---------------------
     df_tickets = find_top_tickets('anvil')
+    df_tickets['customernote'] = df_tickets['customernote'].astype(cln_tkts.NOTE_DTYPE)
 
-    df_tickets = strip_jira_formatting(df_tickets)
-    df_tickets = cln_tkts.remove_names(df_tickets)
-    df_tickets = cln_tkts.sep_tickets(df_tickets, False)
-    df_tickets = strip_jira_formatting(df_tickets) # it must be done twice
+    df_tickets = clean_jira_tickets(df_tickets)
 
     if print_var: print(df_tickets.head())
 
-    df_tickets.to_csv(dd, index=False)
+    cln_tkts.save_tickets(df_tickets, dd)
 
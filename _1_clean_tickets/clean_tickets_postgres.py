@@ -40,8 +40,8 @@ def sep_tickets(df: pd.DataFrame, separate: bool) -> pd.DataFrame:
 # Remove generated formatting 
 def strip_formatting(df: pd.DataFrame) -> pd.DataFrame:
 
-    df['customernote'] = df['customernote'].replace(cln_tkts.remove_clutter(), regex=True)
-    df = df[~df['customernote'].str.match(r'^\s*$')]
+    df['customernote'] = df['customernote'].map(cln_tkts.scrub_clutter, na_action='ignore').astype(cln_tkts.NOTE_DTYPE)
+    df = df[df['customernote'].fillna('').str.strip().ne('')]
 
     return df
 
@@ -72,6 +72,7 @@ if __name__ == "__main__":
 
     #-------------------------- Initial Data Cleaning ---------------------
     df_tickets = pd.read_sql(query, engine)
+    df_tickets['customernote'] = df_tickets['customernote'].astype(cln_tkts.NOTE_DTYPE)
 
     df_tickets = cln_tkts.filter_date(df_tickets)
     df_tickets = sep_tickets(df_tickets, False)
@@ -80,4 +81,4 @@ if __name__ == "__main__":
 
     if print_var: print(df_tickets.head())
 
-    df_tickets.to_csv(dd, index=False)
+    cln_tkts.save_tickets(df_tickets, dd)
@@ -14,7 +14,13 @@ from cluster_selection import find_top_tickets
 import warnings
 import os
 import sys
-from bs4 import BeautifulSoup 
+import re
+import multiprocessing as mp
+import csv
+from selectolax.parser import HTMLParser
+from flashtext import KeywordProcessor
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 
 warnings.simplefilter(action='ignore', category=Warning)
@@ -23,13 +29,42 @@ warnings.simplefilter(action='ignore', category=Warning)
 # Resulting data destination
 dd = os.path.join(r"_1_clean_tickets\init_tdx_cln_tkts.csv")
 
+# Arrow-backed string dtype for customernote (less memory, vectorized .str ops run in Arrow kernels)
+NOTE_DTYPE = 'string[pyarrow]'
+
+# Source of staff names to anonymize
+names_path = os.path.join(r"_1_clean_tickets\names.parquet")
+
+# Message separators
+_MSG_SPLIT = re.compile(r'-{30,}')
+_MSG_SEPARATOR = re.compile(r'\-{10}[^a-z]+\-{10}', re.IGNORECASE)
+
+# Sequential instances of name
+_SEQUENTIAL_NAMES = re.compile(r"(?<=name)(?:[^a-z;]*?name)")
+
+# Numbered backreferences (\1) in a pattern or replacement, ignoring escaped backslashes
+_BACKREF = re.compile(r'(?<!\\)((?:\\\\)*)\\([1-9]\d?)')
+
+# Upper bound on cleaning passes per string
+MAX_PASSES = 5
+
+# Number of worker processes for per-ticket cleaning (the regex work is CPU-bound and holds the GIL)
+NUM_WORKERS = os.cpu_count() or 1
+
+# Names keyword processor, rebuilt only when the parquet file changes
+_names_cache = {'mtime': None, 'processor': None}
+
 
 # Strip HTML tags 
 def strip_html(text: str) -> str:
 
-    soup = BeautifulSoup(text or "", 'lxml')
+    text = text or ""
+
+    # Plain text with no tags or entities needs no parsing
+    if "<" not in text and "&" not in text:
+        return text.strip()
 
-    return soup.get_text(separator=" ", strip=True)
+    return HTMLParser(text).text(separator=" ", strip=True)
 
 
 # Separate the tickets by message
@@ -37,12 +72,12 @@ def sep_tickets(df: pd.DataFrame, split: bool = True, separate: bool = True) ->
 
     # Split the messages into different rows
     if split:  
-        df['customernote'] = df['customernote'].str.split(r'-{30,}')
+        df['customernote'] = df['customernote'].str.split(_MSG_SPLIT)
         df = df.explode('customernote')
     
     # Separate the messages in each row
     elif separate:
-        df['customernote'] = df['customernote'].str.replace(r'\-{10}[^a-z]+\-{10}', "; ", regex=True, case=False)
+        df['customernote'] = df['customernote'].str.replace(_MSG_SEPARATOR, "; ", regex=True)
 
     return df
 
@@ -69,52 +104,194 @@ def remove_clutter():
         r'“|”||': '"',
         r'：': ': ',
 
-        # Redundant whitespace
+        # Remove repeating special characters
+        r'\s*(\,|\_)\s*(?=\1)': "",
+
+        # Redundant whitespace (leading/trailing first so they win over ' +' when fused)
+        r'^[\"\s]+': "",
+        r'[\"\s]+$': "",
         r' +': " ",
         r'\n+': "",
         r'(?:\\n)+': "",
-        r'^[\"\s]+': "",
-        r'[\"\s]+$': "",
-
-        # Remove repeating special characters
-        r'\s*(\,|\_)\s*(?=\1)': "",
 
     }
 
 
+# Fuse an ordered {pattern: replacement} dict into a single alternation so each string is scanned once
+def fuse_patterns(patterns: dict) -> tuple:
+
+    parts = []
+    templates = []
+    offset = 0
+
+    for i, (pattern, repl) in enumerate(patterns.items()):
+
+        # Shift numbered backreferences past the groups of the earlier patterns (+1 for the wrapping group)
+        def shift(m: re.Match, fmt: str) -> str:
+            return m.group(1) + fmt.format(int(m.group(2)) + offset + 1)
+
+        fused_pattern = _BACKREF.sub(lambda m: shift(m, r'(?:\{})'), pattern)
+        parts.append(f"(?P<g{i}>{fused_pattern})")
+        templates.append(_BACKREF.sub(lambda m: shift(m, r'\g<{}>'), repl))
+
+        offset += re.compile(pattern).groups + 1
+
+    return re.compile("|".join(parts)), templates
+
+
+# Apply a cleaning function until the text stops changing, since some elements are generated recursively
+# (most strings are stable after one pass, so this is cheaper than cleaning every string twice)
+def fixed_point(clean, text: str) -> str:
+
+    for _ in range(MAX_PASSES):
+        cleaned = clean(text)
+        if cleaned == text:
+            break
+        text = cleaned
+
+    return text
+
+
+# Apply a fused pattern until the text stops changing
+def scrub(text: str, fused: re.Pattern, templates: list) -> str:
+
+    def dispatch(m: re.Match) -> str:
+        repl = templates[int(m.lastgroup[1:])]
+        return m.expand(repl) if "\\" in repl else repl
+
+    return fixed_point(lambda t: fused.sub(dispatch, t), text)
+
+
+# Clutter patterns fused once for every cleaning pass
+CLUTTER_RE, CLUTTER_REPL = fuse_patterns(remove_clutter())
+
+
+# Remove misc elements from a single message
+def scrub_clutter(text: str) -> str:
+
+    return scrub(text, CLUTTER_RE, CLUTTER_REPL)
+
+
+# Remove automatically generated elements
+def auto_gen_elements() -> dict:
+
+    with open(os.path.join(r"_1_clean_tickets\auto_gen_rep.txt"), "r") as f:
+        return {line.strip(): "" for line in f.readlines() if line.strip()}
+
+
+# Clutter and automatically generated elements, read and fused once at import rather than on every clean_tickets call
+ALL_RE, ALL_REPL = fuse_patterns({**remove_clutter(), **auto_gen_elements()})
+
+
+# Apply a per-string cleaning function to every note, spread over a process pool for larger inputs
+# (func must be a module-level function so it can be pickled)
+def parallel_map(func, notes: list, chunksize: int = 256) -> list:
+
+    if NUM_WORKERS <= 1 or len(notes) <= chunksize:
+        return [func(note) for note in notes]
+
+    with mp.Pool(NUM_WORKERS) as pool:
+        return pool.map(func, notes, chunksize=chunksize)
+
+
+# Remove clutter and automatically generated elements from a single message
+def scrub_ticket(note: str) -> str:
+
+    if not isinstance(note, str):
+        return note
+
+    return scrub(note, ALL_RE, ALL_REPL)
+
+
 # Remove anything that isn't the core message
 def clean_tickets(df: pd.DataFrame) -> pd.DataFrame:
     
-    to_remove = remove_clutter()
-    
-    # Remove automatically generated elements
-    with open(os.path.join(r"_1_clean_tickets\auto_gen_rep.txt"), "r") as f:
-        for line in f.readlines():
-            to_remove[line.strip()] = ""
-    
     # Apply regex cleaning and others
-    df['customernote'] = df['customernote'].replace(to_remove, regex=True)
-    df['customernote'] = df['customernote'].replace(to_remove, regex=True) # some elements are generated recursively, so this must be done twice to remove everything unwanted
+    df['customernote'] = pd.Series(parallel_map(scrub_ticket, df['customernote'].tolist()), index=df.index, dtype=NOTE_DTYPE)
 
     df['customernote'] = df['customernote'].str.strip(r'\"\. ')
-    df = df[~df['customernote'].str.match(r'^\s*$')]
+    df = df[df['customernote'].fillna('').str.strip().ne('')]
 
     return df 
 
 
+# Build an Aho-Corasick style keyword matcher for the names, reusing the cached one while names.parquet is unchanged
+# (one pass per string regardless of how many names there are, unlike a regex alternation)
+def names_processor() -> KeywordProcessor:
+
+    mtime = os.path.getmtime(names_path)
+    if _names_cache['mtime'] != mtime:
+        users = pd.read_parquet(names_path)
+        processor = KeywordProcessor(case_sensitive=False) # keywords only match between non-alphanumeric boundaries
+        processor.set_non_word_boundaries(processor.non_word_boundaries - {'_'}) # flashtext counts '_' as a word character; names next to it (e.g. smith_lab) must still match
+        for user in users['name']:
+            processor.add_keyword(user, "name")
+        _names_cache['processor'] = processor
+        _names_cache['mtime'] = mtime
+
+    return _names_cache['processor']
+
+
+# Replace names in a single message
+def anonymize(note: str, processor: KeywordProcessor) -> str:
+
+    # Replace unique names with name
+    note = processor.replace_keywords(note)
+
+    return _SEQUENTIAL_NAMES.sub("", note) # remove sequential instances of name
+
+
+# Anonymize a single message with the cached names processor (module-level so process pools can pickle it)
+def anonymize_note(note: str) -> str:
+
+    if not isinstance(note, str):
+        return note
+
+    return anonymize(note, _names_cache['processor'] or names_processor())
+
+
+# Separate the messages within a single message string
+def separate_messages(note: str) -> str:
+
+    return _MSG_SEPARATOR.sub("; ", note)
+
+
 # Remove names from customer note
 def remove_names(df: pd.DataFrame) -> pd.DataFrame:
 
-    # Replace unique names with name
-    users = pd.read_parquet(os.path.join(r"_1_clean_tickets\names.parquet"))
-    re_users = r"(?<![a-z\d])(?:" + "|".join(users['name']) + r")(?![a-z\d])"
-    df['customernote'] = df['customernote'].str.replace(re_users, "name", case=False, regex=True)
+    names_processor() # refresh the cache once before the workers read it
+    df['customernote'] = pd.Series(parallel_map(anonymize_note, df['customernote'].tolist()), index=df.index, dtype=NOTE_DTYPE)
+
+    return df
+
 
-    df['customernote'] = df['customernote'].str.replace("(?<=name)(?:[^a-z;]*?name)", "", regex=True) # remove sequential instances of name
+# Render columns Arrow would format differently from to_csv (timestamps, booleans, floats, mixed objects) as pandas text
+def csv_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+
+    df = df.copy()
+    for col in df.columns:
+        if not isinstance(df[col].dtype, pd.StringDtype) and not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
 
     return df
 
 
+# Save cleaned tickets with Arrow's multithreaded C++ CSV writer (falls back to to_csv for columns Arrow cannot convert)
+def save_tickets(df: pd.DataFrame, path: str) -> None:
+
+    try:
+        table = pa.Table.from_pandas(csv_text_columns(df), preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df.to_csv(path, index=False)
+        return
+
+    # Header is written like to_csv (Arrow always quotes column names)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f, lineterminator="\n").writerow(df.columns)
+    with open(path, "ab") as f:
+        pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(include_header=False, quoting_style="needed"))
+
+
 if __name__ == "__main__":
 
     # Decide whether to print or not
@@ -129,7 +306,7 @@ if __name__ == "__main__":
     df_tickets = df_tickets.iloc[3:].reset_index(drop=True)
 
 
-    df_tickets['customernote'] = df_tickets['customernote'].apply(strip_html)
+    df_tickets['customernote'] = pd.Series([strip_html(t) for t in df_tickets['customernote']], index=df_tickets.index, dtype=NOTE_DTYPE)
     df_tickets = clean_tickets(df_tickets)
     df_tickets = remove_names(df_tickets)
     df_tickets = sep_tickets(df_tickets, split=False)
@@ -137,5 +314,5 @@ if __name__ == "__main__":
     if print_var: print(df_tickets.head())
 
     # Save dataframe
-    df_tickets.to_csv(dd, index=False)
+    save_tickets(df_tickets, dd)
 
@@ -15,21 +15,32 @@ import re                       # Regular expressions for text extraction
 import pandas as pd            # DataFrame operations
 from tqdm import tqdm          # Progress bar for loops
 import requests                # HTTP requests to the GenAI API
-from torch.utils.data import DataLoader, Dataset  # Batch management for API calls
+from requests.adapters import HTTPAdapter         # Connection pooling for concurrent API calls
+from urllib3.util.retry import Retry              # Automatic retry with backoff for API calls
+from concurrent.futures import ThreadPoolExecutor # Concurrent API calls (I/O-bound)
 from transformers import AutoTokenizer            # Tokenizer to measure prompt length
 import time                    # Timing for retries
-from nltk import sent_tokenize # Sentence splitting
+from nltk.tokenize.punkt import PunktTokenizer # Sentence splitting
 from dotenv import load_dotenv # Load API key from environment
 import random                  # Add randomness to retry delay
 import nltk
 import os
 
+# Optional: Intel Hyperscan matches all closure patterns in a single pass (falls back to Python's re if not installed)
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
 # Extend NLTK’s search path to look in the local folder for tokenizer data
 nltk.data.path.append(os.path.join(os.getcwd(), '_2_summarize_tickets'))
 
 # Manually verify that NLTK’s Punkt tokenizer is available (raises error if not found)
 nltk.data.find('tokenizers/punkt_tab')
 
+# Load the pretrained English Punkt model once instead of resolving it on every sent_tokenize call
+sentence_tokenizer = PunktTokenizer("english")
+
 # -------------------- Initial Config -------------------------------
 GENAI_API_URL = "https://genai.rcac.purdue.edu/api/chat/completions"
 
@@ -40,8 +51,11 @@ GENAI_API_KEY = os.getenv("GENAI_API_KEY")
 # This is the tag used for the finetuned Mistral model container
 GENAI_MODEL = "cjoslin22/Finetuned_Mistral-7.2B-Q8_0:latest"
 
-# Number of prompts sent per API call (tune for performance/memory)
-BATCH_SIZE = 2
+# Number of prompts sent to the API concurrently (tune to the API's rate limit)
+MAX_WORKERS = 16
+
+# Number of automatic retries per request for transient API errors
+MAX_RETRIES = 7
 
 # Truncation safeguard: drop prompts longer than this
 MAX_PROMPT_LENGTH = 1621 # 10% data loss
@@ -57,105 +71,124 @@ tokenizer = AutoTokenizer.from_pretrained("_2_summarize_tickets/tokenizer_filter
 df_tickets = pd.read_csv(f"_1_clean_tickets/init_{TICKET_SRC}_cln_tkts.csv")
 
 # -------------------- Build Prompts ------------------------------------
+# Static instructions shared by every prompt; the ticket message is appended after it
+TEMPLATE_PREFIX = (
+    "You are an expert HPC support assistant. Your job is to extract key information from HPC support ticket messages for documentation purposes. "
+    "Your output will be used to generate FAQs and help users resolve issues independently.\n\n"
+    "Your task:\n"
+    "Extract and clearly report the *Issue Summary* and *Resolution* from the ticket message. Follow this format **exactly**, and ensure the response includes any specific technical details mentioned "
+    "(e.g., command-line examples, module names, tool names, documentation URLs, file paths) **whenever present**.\n\n"
+    "**Do NOT** include:\n"
+    "- Bullet points\n"
+    "- Extra commentary\n"
+    "- Any names, titles, greetings, or sign-offs\n"
+    "- References to the original message\n"
+    "- Any mention of ticket status (e.g., resolved, closed, reopened)\n"
+    "- Any suggestion to follow up or reopen the ticket\n\n"
+    "**Output Format:**\n\n"
+    "1. Issue Summary:  [Insert brief issue description]\n\n"
+    "2. Resolution:  [Insert detailed resolution, including any commands, links, or configuration details]\n\n"
+    "The full ticket message appears below. Do NOT copy or summarize it.\n"
+)
+
 # Function to wrap a ticket message in a clean prompt format for the LLM
 def build_prompt(note):
-    return (
-        "You are an expert HPC support assistant. Your job is to extract key information from HPC support ticket messages for documentation purposes. "
-        "Your output will be used to generate FAQs and help users resolve issues independently.\n\n"
-        "Your task:\n"
-        "Extract and clearly report the *Issue Summary* and *Resolution* from the ticket message. Follow this format **exactly**, and ensure the response includes any specific technical details mentioned "
-        "(e.g., command-line examples, module names, tool names, documentation URLs, file paths) **whenever present**.\n\n"
-        "**Do NOT** include:\n"
-        "- Bullet points\n"
-        "- Extra commentary\n"
-        "- Any names, titles, greetings, or sign-offs\n"
-        "- References to the original message\n"
-        "- Any mention of ticket status (e.g., resolved, closed, reopened)\n"
-        "- Any suggestion to follow up or reopen the ticket\n\n"
-        "**Output Format:**\n\n"
-        "1. Issue Summary:  [Insert brief issue description]\n\n"
-        "2. Resolution:  [Insert detailed resolution, including any commands, links, or configuration details]\n\n"
-        "The full ticket message appears below. Do NOT copy or summarize it.\n"
-        f"{note}"
-    )
-
-# Apply the prompt builder to each customer note
-df_tickets["prompt"] = df_tickets["customernote"].apply(build_prompt)
+    return TEMPLATE_PREFIX + f"{note}"
 
 # ---------------------- Length Filter -----------------------------------
-# Define a helper to compute the number of tokens in each prompt
-def prompt_length(prompt):
-    return len(tokenizer(prompt.strip(), truncation=False)["input_ids"])
-
-# Filter out prompts that exceed model context length
-df_tickets["token_length"] = df_tickets["prompt"].apply(prompt_length)
+# The template is identical for every row, so tokenize it once (includes the BOS token)
+TEMPLATE_TOK_LEN = len(tokenizer(TEMPLATE_PREFIX)["input_ids"])
+
+# Define a helper to compute the number of tokens in each prompt from its note alone
+# (batched so the fast tokenizer encodes each chunk in a single Rust call)
+# Note: counts may differ by a token from tokenizing the full prompt due to merges at the template/note boundary
+def prompt_lengths(notes, chunk_size=1024):
+    lengths = []
+    for start in range(0, len(notes), chunk_size):
+        chunk = [f"{n}".strip() for n in notes[start:start + chunk_size]]
+        encoded = tokenizer(chunk, truncation=False, add_special_tokens=False, return_length=True)
+        lengths.extend(TEMPLATE_TOK_LEN + n for n in encoded["length"])
+    return lengths
+
+# Filter out notes whose prompts would exceed model context length
+df_tickets["token_length"] = prompt_lengths(df_tickets["customernote"].tolist())
 df_tickets = df_tickets[df_tickets["token_length"] <= MAX_PROMPT_LENGTH].reset_index(drop=True)
 
-# ---------------------- Prep for API Call -------------------------------
-# Define a minimal PyTorch Dataset to allow DataLoader batching
-class PromptDataset(Dataset):
-    def __init__(self, prompts): self.prompts = prompts
-    def __len__(self):      return len(self.prompts)
-    def __getitem__(self, i): return self.prompts[i]
+# Apply the prompt builder only to the customer notes that passed the filter
+df_tickets["prompt"] = df_tickets["customernote"].apply(build_prompt)
 
-# Strip whitespace and create a batched DataLoader
+# ---------------------- Prep for API Call -------------------------------
+# Strip whitespace from each prompt
 formatted_prompts = [p.strip() for p in df_tickets["prompt"]]
-dataset = PromptDataset(formatted_prompts)
-dataloader = DataLoader(dataset, batch_size=BATCH_SIZE)
+
+# Retry failures inside urllib3 with exponential backoff: like the original request loop, every
+# 4xx/5xx status is retried except 404 (model not found); 400 also occurs transiently on this API
+RETRY_POLICY = Retry(
+    total=MAX_RETRIES,
+    backoff_factor=0.3,
+    status_forcelist=set(range(400, 600)) - {404},
+    allowed_methods={"POST"},
+    raise_on_status=False,
+)
+
+# Share one session across worker threads so connections are pooled and reused
+session = requests.Session()
+session.mount("https://", HTTPAdapter(max_retries=RETRY_POLICY, pool_connections=MAX_WORKERS, pool_maxsize=2 * MAX_WORKERS))
 
 
 # ---------------------- Helper Functions ---------------------------------
-def call_genai_api(prompts, retries = 7):
-    responses = []
-
-    for i, prompt in enumerate(prompts):
-
-        # Clean up the prompt: remove trailing semicolon/quotes/extra whitespace 
-        prompt = re.sub(r'["\']?\s*;\s*$', '', prompt.strip())  # remove trailing semicolon junk
-        prompt = prompt.rstrip("\n\t ")  # remove any whitespace left
-
-        # Prepare HTTP headers and request body for GenAI API    
-        headers = {
-        "Authorization": f"Bearer {GENAI_API_KEY}",
-        "Content-Type": "application/json"
-        }
-        body = {
-        "model": GENAI_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": False
-        }
-
-         # Attempt request with up to `retries` retries
-        for attempt in range(retries):
-            try:
-                r = requests.post(GENAI_API_URL, headers=headers, json=body)
-                # Success: parse and store output 
-                if r.status_code == 200:
-                    print(f"✅ Valid Request after {attempt + 1} attempt(s)")
-                    data = r.json()
-                    content = data["choices"][0]["message"]["content"]
-                    responses.append(content)
-                    break
-                # Model not found - unrecoverable 
-                elif r.status_code == 404:  # TODO: Train a backup finetuned model 
-                    print(f"⚠️[Prompt {i}] Model not found (404). Not retrying.")
-                    responses.append("")
-                    break
-                # Other errors - retry with delay  
-                else:
-                    print(f"❌[Prompt {i}] {r.status_code} on attempt {attempt+1} retrying..")
-                    time.sleep(0.3*(attempt + 1) + random.uniform(0,0.2))  # light exponential delay based on retry attempt number
-            # Handle connection or network issues (e.g., timeout, connection error)
-            except requests.exceptions.RequestException as e:  
-                print(f"⚠️[Prompt {i}] Request failed: {e}")
-                responses.append("")
-                break
-        else:
-            # All retry attempts failed 
-            print("⚠️<UNABLE TO GENERATE>")
-            responses.append("")
+def call_genai_single(i, prompt):
+    # Clean up the prompt: remove trailing semicolon/quotes/extra whitespace 
+    prompt = re.sub(r'["\']?\s*;\s*$', '', prompt.strip())  # remove trailing semicolon junk
+    prompt = prompt.rstrip("\n\t ")  # remove any whitespace left
+
+    # Prepare HTTP headers and request body for GenAI API    
+    headers = {
+    "Authorization": f"Bearer {GENAI_API_KEY}",
+    "Content-Type": "application/json"
+    }
+    body = {
+    "model": GENAI_MODEL,
+    "messages": [{"role": "user", "content": prompt}],
+    "stream": False
+    }
+
+    # Send request; transient failures are retried with exponential backoff by the session's urllib3 adapter
+    try:
+        r = session.post(GENAI_API_URL, headers=headers, json=body)
+    # Handle connection or network issues that persisted through every retry (e.g., timeout, connection error)
+    except requests.exceptions.RequestException as e:  
+        print(f"⚠️[Prompt {i}] Request failed: {e}")
+        return ""
+
+    attempts = len(r.raw.retries.history) + 1 if r.raw.retries else 1
+
+    # Success: parse and store output 
+    if r.status_code == 200:
+        # A malformed body is treated like a failed request (the prompt is retried later) instead of aborting the run
+        try:
+            data = r.json()
+            content = data["choices"][0]["message"]["content"]
+        except (requests.exceptions.RequestException, KeyError, IndexError) as e:
+            print(f"⚠️[Prompt {i}] Malformed response: {e}")
+            return ""
+        print(f"✅ Valid Request after {attempts} attempt(s)")
+        return content
+    # Model not found - unrecoverable 
+    elif r.status_code == 404:  # TODO: Train a backup finetuned model 
+        print(f"⚠️[Prompt {i}] Model not found (404). Not retrying.")
+        return ""
+
+    # All retry attempts failed 
+    print(f"⚠️<UNABLE TO GENERATE> [Prompt {i}] {r.status_code} after {attempts} attempt(s)")
+    return ""
+
+def call_genai_api(prompts, show_progress = False):
+    # Requests are independent and I/O-bound, so send them concurrently (map preserves input order)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = ex.map(call_genai_single, range(len(prompts)), prompts)
+        return list(tqdm(futures, total=len(prompts), desc="Calling GenAI API", disable=not show_progress))
 
-    return responses
 
 def extract_issue_resolution(text):
     """
@@ -172,19 +205,23 @@ def extract_issue_resolution(text):
 results = [] # List of generated summaries 
 prompts = [] # List of sent prompts (in same order as results)
 
-# Batch process all prompts using DataLoader 
-for batch in tqdm(dataloader, desc="Calling GenAI API"): 
-    outputs = call_genai_api(batch)
+# Send each distinct prompt only once (duplicate boilerplate notes are common), preserving first-seen order
+unique_prompts = list(dict.fromkeys(formatted_prompts))
+print(f"{len(formatted_prompts) - len(unique_prompts)} duplicate prompts skipped")
 
-    for prompt, output in zip(batch, outputs):
-        norm_p = "".join(prompt.split())
-        norm_o = "".join(output.strip().split())
-        
-        # Clean regurgitated prompt from output if present 
-        if norm_o.startswith(norm_p): 
-            output = output[len(prompt):].strip()
-        results.append(output)
-        prompts.append(prompt)
+# Process all unique prompts concurrently and map the responses back to every row
+unique_outputs = dict(zip(unique_prompts, call_genai_api(unique_prompts, show_progress=True)))
+outputs = [unique_outputs[prompt] for prompt in formatted_prompts]
+
+for prompt, output in zip(formatted_prompts, outputs):
+    norm_p = "".join(prompt.split())
+    norm_o = "".join(output.strip().split())
+    
+    # Clean regurgitated prompt from output if present 
+    if norm_o.startswith(norm_p): 
+        output = output[len(prompt):].strip()
+    results.append(output)
+    prompts.append(prompt)
 
 print("Retrying failed prompts...")
 max_retries = 5
@@ -193,7 +230,7 @@ for i, (prompt, result) in enumerate(zip(prompts, results)):
     if result.strip() == "":
         num_prompts += 1
         for attempt in range(max_retries):
-            retry = call_genai_api([prompt])[0]
+            retry = call_genai_single(i, prompt)
             if retry.strip():
                 # Remove regurgitated prompt again if necessary 
                 norm_p = "".join(prompt.split())
@@ -226,6 +263,80 @@ df_tickets[["issue_summary", "resolution"]] = df_tickets["ticket_summary"].apply
 # Retain only relevant columns
 df_tickets = df_tickets[['issuenumber', 'title', 'issue_summary', 'resolution']]
 
+# Patterns for generic closure/filler sentences; any match drops the sentence
+SKIP_PATTERNS = [
+    # Reopen and follow-up language
+    r"re[-\s]?open( the)? ticket",
+    r"(reply|respond|contact).*?(within|in|next).*?\d+\s*(days?|hours?)",
+    r"ticket (remains|will remain) open",
+    r"ticket (will|may)?\s*(be\s*)?(close[sd]?|closed)",
+    r"reopen the current ticket.*?open a new one",
+
+    # Resolution confirmation or closure
+    r"(ticket|issue).*?marked\s*(as\s*)?resolved",
+    r"(ticket|issue).*?(was|is|has been)?\s*(closed|considered resolved)",
+    r"(the )?ticket was resolved",
+    r"mark(ed|ing)? (the )?ticket as resolved",
+    r"(resolving this|closing ticket|ticket'?s closure)",
+
+    # New ticket creation
+    r"(create|submit|open).*?a new (support )?ticket",
+    r"a new ticket.*?(can|may|would|should).*?(be created|required|submitted)",
+    r"a new ticket", # covers all remaining cases of "a new ticket" mentioned
+
+    # Gratitude and acknowledgments
+    r"(expressed|indicated).*?(gratitude|thanks|appreciation|satisfaction)",
+    r"appreciated the assistance",
+
+    # Encouragement to follow up or contact
+    r"(feel free|don’t hesitate|you can).*?(contact|reach out)",
+    r"user was advised to contact.*?(support|help)",
+    r"further assistance.*?(is|was)?\s*(available|provided|needed)",
+
+    # Lack of response or no action required
+    r"no further action.*?(is|was)?\s*required",
+    r"(no further response|no response).*?(from the user)?",
+    r"ticket.*?resolved.*?no response",
+    r"no further issues were reported",
+
+    # Model regurgitation / footers
+    r"^please note",
+    r"(bullet points|commentary|names|greetings|sign[- ]?offs|references).*?(removed|excluded|not included|stripped)",
+    r"suggestion(s)? to (follow[- ]?up|re[- ]?open).*?(excluded|omitted|removed)",
+
+    # Signature lines or affiliations
+    r"(Regards|Sincerely|Thank you).*\n.*(Ph\.?D|University|Department of)",
+]
+
+# Single case-insensitive alternation so each sentence is tested with one regex call
+SKIP_RE = re.compile("|".join(f"(?:{p})" for p in SKIP_PATTERNS), re.IGNORECASE)
+
+# Multi-pattern Hyperscan database compiled once from the same patterns, if available
+if hyperscan is not None:
+    skip_db = hyperscan.Database()
+    skip_db.compile(
+        expressions=[p.encode() for p in SKIP_PATTERNS],
+        ids=list(range(len(SKIP_PATTERNS))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8] * len(SKIP_PATTERNS),
+    )
+else:
+    skip_db = None
+
+# Check whether a sentence matches any closure pattern
+def is_boilerplate(sentence):
+    if skip_db is None:
+        return SKIP_RE.search(sentence) is not None
+
+    def on_match(pattern_id, start, end, flags, context):
+        return True # stop scanning at the first match
+
+    # Returning True from the handler halts the scan, which hyperscan reports by raising ScanTerminated
+    try:
+        skip_db.scan(sentence.encode(), match_event_handler=on_match)
+    except hyperscan.ScanTerminated:
+        return True
+    return False
+
 # Clean closure phrases in resolutions
 def remove_generic_closure_sentences(text):
     """
@@ -245,7 +356,7 @@ def remove_generic_closure_sentences(text):
     - Keep only informative, technical content.
     """
 
-    sentences = sent_tokenize(text) # Break resolution into individual sentences 
+    sentences = sentence_tokenizer.tokenize(text) # Break resolution into individual sentences 
     cleaned = []
 
     for s in map(str.strip, sentences):
@@ -254,47 +365,8 @@ def remove_generic_closure_sentences(text):
         if s == "" or re.fullmatch(r"[\"';\s]+", s): continue
         if re.search(r"^[;\"'\s]{2,}$", s): continue
 
-        # Reopen and follow-up language
-        if re.search(r"(?i)re[-\s]?open( the)? ticket", s): continue
-        if re.search(r"(?i)(reply|respond|contact).*?(within|in|next).*?\d+\s*(days?|hours?)", s): continue
-        if re.search(r"(?i)ticket (remains|will remain) open", s): continue
-        if re.search(r"(?i)ticket (will|may)?\s*(be\s*)?(close[sd]?|closed)", s): continue
-        if re.search(r"(?i)reopen the current ticket.*?open a new one", s): continue
-
-        # Resolution confirmation or closure
-        if re.search(r"(?i)(ticket|issue).*?marked\s*(as\s*)?resolved", s): continue
-        if re.search(r"(?i)(ticket|issue).*?(was|is|has been)?\s*(closed|considered resolved)", s): continue
-        if re.search(r"(?i)(the )?ticket was resolved", s): continue
-        if re.search(r"(?i)mark(ed|ing)? (the )?ticket as resolved", s): continue
-        if re.search(r"(?i)(resolving this|closing ticket|ticket'?s closure)", s): continue
-
-        # New ticket creation
-        if re.search(r"(?i)(create|submit|open).*?a new (support )?ticket", s): continue
-        if re.search(r"(?i)a new ticket.*?(can|may|would|should).*?(be created|required|submitted)", s): continue
-        if re.search(r"(?i)a new ticket", s): continue # covers all remaining cases of "a new ticket" mentioned
-
-        # Gratitude and acknowledgments
-        if re.search(r"(?i)(expressed|indicated).*?(gratitude|thanks|appreciation|satisfaction)", s): continue
-        if re.search(r"(?i)appreciated the assistance", s): continue
-
-        # Encouragement to follow up or contact
-        if re.search(r"(?i)(feel free|don’t hesitate|you can).*?(contact|reach out)", s): continue
-        if re.search(r"(?i)user was advised to contact.*?(support|help)", s): continue
-        if re.search(r"(?i)further assistance.*?(is|was)?\s*(available|provided|needed)", s): continue
-
-        # Lack of response or no action required
-        if re.search(r"(?i)no further action.*?(is|was)?\s*required", s): continue
-        if re.search(r"(?i)(no further response|no response).*?(from the user)?", s): continue
-        if re.search(r"(?i)ticket.*?resolved.*?no response", s): continue
-        if re.search(r"(?i)no further issues were reported", s): continue
-
-        # Model regurgitation / footers
-        if re.search(r"(?i)^please note", s): continue
-        if re.search(r"(?i)(bullet points|commentary|names|greetings|sign[- ]?offs|references).*?(removed|excluded|not included|stripped)", s): continue
-        if re.search(r"(?i)suggestion(s)? to (follow[- ]?up|re[- ]?open).*?(excluded|omitted|removed)", s): continue
-
-        # Signature lines or affiliations
-        if re.search(r"(?i)(Regards|Sincerely|Thank you).*\n.*(Ph\.?D|University|Department of)", s): continue
+        # Skip boilerplate (reopen/follow-up, closure, new ticket, gratitude, contact, no response, regurgitation, signatures)
+        if is_boilerplate(s): continue
 
         # If none of the rules match, keep the sentence
         cleaned.append(s)
@@ -302,7 +374,7 @@ def remove_generic_closure_sentences(text):
     return " ".join(cleaned)
 
 # Apply cleaning to the resolution column
-df_tickets["resolution"] = df_tickets["resolution"].apply(remove_generic_closure_sentences)
+df_tickets["resolution"] = [remove_generic_closure_sentences(text) for text in df_tickets["resolution"].tolist()]
 
 # -------------------- Save Cleaned Data --------------------
 df_tickets.to_csv(f"_2_summarize_tickets/{TICKET_SRC}_ticket_summaries.csv", index=False) 
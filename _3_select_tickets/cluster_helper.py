@@ -18,17 +18,47 @@ import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
-# Embedding and similarity
-from sklearn.metrics.pairwise import cosine_similarity
+# Embedding and similarity (vectors are unit-normalized, so cosine similarity is a plain matrix product)
 from sklearn.preprocessing import MinMaxScaler, normalize
 
 # Clustering
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
+from joblib import Parallel, delayed
+
+# Number of times k-means runs with different centroid seeds to ensure robustness to high-dimensionality
+N_INIT = 50
 
 # Utility
 import csv
 
+# -------------------- Parallel KMeans Initializations --------------------
+def _single_init(X, k, seed):
+    """
+    Runs a single k-means initialization and returns its labels, centroids, and inertia.
+    """
+    kmeans = KMeans(n_clusters=k, random_state=seed, n_init=1).fit(X)
+    return kmeans.labels_, kmeans.cluster_centers_, kmeans.inertia_
+
+
+def _best_kmeans_per_k(X, k_values, n_init=N_INIT, random_state=42):
+    """
+    Runs n_init k-means initializations for every k across all cores (scikit-learn runs them
+    serially) and keeps the lowest-inertia run per k. Returns {k: (labels, centroids, inertia)}.
+    loky workers limit their own BLAS/OpenMP threads, so the cores are not oversubscribed.
+    """
+    seeds = np.random.RandomState(random_state).randint(0, 2**31 - 1, size=n_init)
+    tasks = [(k, seed) for k in k_values for seed in seeds]
+
+    results = Parallel(n_jobs=-1, backend="loky")(delayed(_single_init)(X, k, seed) for k, seed in tasks)
+
+    best = {}
+    for (k, _), result in zip(tasks, results):
+        if k not in best or result[2] < best[k][2]:
+            best[k] = result
+    return best
+
+
 # -------------------- Optimal k Selection --------------------
 def compute_best_k(X, total):
     """
@@ -37,8 +67,12 @@ def compute_best_k(X, total):
     """
     candidate_scores = [] # Keeps track of the best k and its corresponding silhouette score
 
-    for k in range(2, 5): # Iterates through k values from 2 to 4 (found to be the best balance between over- and underfitting due to the parent cluster sizes (~90 tickets))
-          labels = KMeans(n_clusters=k, random_state=42, n_init=50).fit(X).labels_ # Number of times k-means runs with different centroid seeds (n_init=50) to ensure robustness to high-dimensionality
+    # Iterates through k values from 2 to 4 (found to be the best balance between over- and underfitting due to the parent cluster sizes (~90 tickets))
+    # All k values and initializations are fit in a single parallel sweep
+    best_runs = _best_kmeans_per_k(X, range(2, 5))
+
+    for k in range(2, 5):
+          labels = best_runs[k][0]
           unique, counts = np.unique(labels, return_counts=True)
 
           max_prop = counts.max() / total
@@ -67,48 +101,53 @@ def subcluster_embeddings_kmeans(embeddings, k):
     Applies KMeans clustering to group high-dimensional sentence embeddings into subclusters.
     Returns both the predicted labels and centroids.
     """
-    kmeans = KMeans(
-        n_clusters=k,
-        random_state=42,
-        n_init=50
-    )
-
-    # Fit the model and predict cluster labels
-    labels = kmeans.fit_predict(embeddings)
-
-    # Extract the cluster centroids for downstream use (e.g., visualization, scoring)
-    centroids = kmeans.cluster_centers_
+    # Fit n_init initializations in parallel and keep the lowest-inertia labels
+    # and centroids (for downstream use, e.g., visualization, scoring)
+    labels, centroids, _ = _best_kmeans_per_k(embeddings, [k])[k]
 
     return labels, centroids
 
 # -------------------- Rank Entries by Centroid --------------------
-def get_top_entries_by_centroid(embeddings, centroid, df):
+def get_top_entries_by_centroid(embeddings, centroid, df, assume_normalized=False, top_k=None):
   """
   Returns ticket issue summaries and resolutions sorted by similarity to subcluster centroid.
   Used for selecting most representative examples for FAQ generation.
+  Only the top_k most similar entries are returned (all entries if top_k is None).
+  Pass assume_normalized=True when embeddings and centroid are already unit-length.
   """
   # Ensure inputs are 2D
   centroid = centroid.reshape(1,-1)
 
   # Normalize both embeddings and centroid since we are using cosine similarity
-  norm_embeddings = normalize(embeddings)
-  norm_centroid = normalize(centroid)
+  if assume_normalized:
+    norm_embeddings, norm_centroid = embeddings, centroid
+  else:
+    norm_embeddings = normalize(embeddings)
+    norm_centroid = normalize(centroid)
 
   # Compute cosine similarities
-  similarities = cosine_similarity(norm_embeddings, norm_centroid).flatten()
-
-  # Sort by most similar indices
-  top_indices = similarities.argsort()[::-1]
-
-  # Extract text
-  top_summaries = df.loc[top_indices, 'issue_summary'].tolist()
-  top_resolutions = df.loc[top_indices, 'resolution'].dropna().tolist()
+  similarities = (norm_embeddings @ norm_centroid.T).flatten()
+
+  # Sort by most similar indices; when only the top_k are needed, partition first and sort just those
+  if top_k is None:
+    top_k = len(similarities)
+  if top_k < len(similarities):
+    idx = np.argpartition(-similarities, top_k)[:top_k]
+    top_indices = idx[np.argsort(-similarities[idx])]
+  else:
+    top_indices = similarities.argsort()[::-1]
+
+  # Extract text by position (df has a fresh RangeIndex upstream, so positions == labels)
+  top_summaries = df['issue_summary'].to_numpy()[top_indices].tolist()
+  resolutions = df['resolution'].to_numpy()[top_indices]
+  has_resolution = df['resolution'].notna().to_numpy()[top_indices]
+  top_resolutions = resolutions[has_resolution].tolist()
 
   return top_summaries, top_resolutions
 
 
 # -------------------- Cohesion & Separation Metrics --------------------
-def compute_cohesion(embeddings):
+def compute_cohesion(embeddings, assume_normalized=False):
     """
     Measures intra-subcluster similarity by computing the average pairwise cosine similarity
     between all vectors in a subcluster. This gives a proxy for how "tight" or cohesive a group is.
@@ -116,15 +155,17 @@ def compute_cohesion(embeddings):
     Closer to 1 = more cohesive and tighter clusters
     Closer to 0 = less cohesive and more scattered clusters
 
+    Pass assume_normalized=True when the embeddings are already unit-length.
     """
     # Re-normalize again since we are using cosine similarity
-    embeddings = normalize(embeddings)
+    if not assume_normalized:
+        embeddings = normalize(embeddings)
 
     # Get number of embedding vectors
     n_samples = embeddings.shape[0]
 
     # Compute cosine similarity matrix (n_samples x n_samples)
-    sim_matrix = cosine_similarity(embeddings)
+    sim_matrix = embeddings @ embeddings.T
 
     # Compute total sum of similarities
     total_sim = np.sum(sim_matrix)
@@ -136,7 +177,7 @@ def compute_cohesion(embeddings):
     return (total_sim - diagonal) / (n_samples * (n_samples - 1))
 
 
-def compute_separation(embeddings_a, embeddings_b):
+def compute_separation(embeddings_a, embeddings_b, assume_normalized=False):
     """
     Measures inter-subcluster dissimilarity by computing the average pairwise cosine distance
     between vectors from different subclusters. This provides an indication of how distinct or
@@ -145,14 +186,17 @@ def compute_separation(embeddings_a, embeddings_b):
     Return the complement of the separation score to have high values be ideal.
 
     The equation used is the average linkage clustering formula
+
+    Pass assume_normalized=True when both sets of embeddings are already unit-length.
     """
 
     # Re-normalize again since we are using cosine similarity
-    embeddings_a = normalize(embeddings_a)
-    embeddings_b = normalize(embeddings_b)
+    if not assume_normalized:
+        embeddings_a = normalize(embeddings_a)
+        embeddings_b = normalize(embeddings_b)
 
     # Calculate cross-cluster similarity matrix
-    sim_matrix = cosine_similarity(embeddings_a, embeddings_b)
+    sim_matrix = embeddings_a @ embeddings_b.T
 
     # Sum all pairwise similarities
     total_sim = np.sum(sim_matrix)
@@ -164,6 +208,43 @@ def compute_separation(embeddings_a, embeddings_b):
     return 1 - (total_sim / n_comparisons)
 
 
+def compute_similarity_matrix(embeddings, assume_normalized=False):
+    """
+    Computes the full pairwise cosine similarity matrix for a parent cluster in a single
+    matrix product, so cohesion and separation for every subcluster can be read from it
+    without recomputing similarities per subcluster pair.
+    """
+    # Normalize once; cosine similarity is then just the dot product
+    if not assume_normalized:
+        embeddings = normalize(embeddings)
+
+    return embeddings @ embeddings.T
+
+
+def cohesion_separation_from_similarity(sim_matrix, labels, k):
+    """
+    Computes compute_cohesion and the mean compute_separation against all other subclusters
+    for every subcluster at once, from a precomputed similarity matrix.
+    Returns two arrays of length k (cohesions, separations).
+    """
+    # One-hot label matrix (k x n_samples); L @ S @ L.T sums the similarities of every
+    # (subcluster, subcluster) block in a single pass
+    one_hot = np.eye(k)[labels].T
+    pair_sums = one_hot @ sim_matrix @ one_hot.T
+    counts = np.bincount(labels, minlength=k)
+
+    # Cohesion: subtract self-similarity and normalize by number of unique pairwise comparisons
+    diagonals = np.bincount(labels, weights=np.diag(sim_matrix), minlength=k)
+    cohesions = (np.diag(pair_sums) - diagonals) / (counts * (counts - 1))
+
+    # Separation: complement of each average cross-cluster similarity, averaged over the other subclusters
+    pair_separations = 1 - pair_sums / np.outer(counts, counts)
+    np.fill_diagonal(pair_separations, 0.0)
+    separations = pair_separations.sum(axis=1) / (k - 1) if k > 1 else np.zeros(k)
+
+    return cohesions, separations
+
+
 # -------------------- Subcluster Ranking --------------------
 def compute_ranked_scores(subclusters, size_weight, cohesion_weight, separation_weight):
     """
@@ -176,32 +257,33 @@ def compute_ranked_scores(subclusters, size_weight, cohesion_weight, separation_
     """
 
     # Extract raw metrics
-    sizes = np.array([s["size"] for s in subclusters])
-    cohesions = np.array([s["cohesion"] for s in subclusters])
-    separations = np.array([s["separation"] for s in subclusters])
+    n = len(subclusters)
+    sizes = np.fromiter((s["size"] for s in subclusters), dtype=float, count=n)
+    cohesions = np.fromiter((s["cohesion"] for s in subclusters), dtype=float, count=n)
+    separations = np.fromiter((s["separation"] for s in subclusters), dtype=float, count=n)
 
     # Normalize size metric only
     scaler = MinMaxScaler()
     normalized_sizes = scaler.fit_transform(sizes.reshape(-1, 1)).flatten()
 
 
-    # Assign final score to each subcluster
-    for i, s in enumerate(subclusters):
-        score = (
-            size_weight * normalized_sizes[i] +
-            cohesion_weight * cohesions[i] +
-            separation_weight * separations[i]
-        )
+    # Compute the final score for all subclusters at once
+    scores = (
+        size_weight * normalized_sizes +
+        cohesion_weight * cohesions +
+        separation_weight * separations
+    )
 
-        # Store rank/z details
-        s["normalized_size"] = normalized_sizes[i]
-        s["score"] = score
+    # Store rank/z details on each subcluster
+    for s, normalized_size, score in zip(subclusters, normalized_sizes, scores):
+        s["normalized_size"] = float(normalized_size)
+        s["score"] = float(score)
 
         # print(f"Parent Cluster {s['cluster']} → "
         #       f"Subcluster {s['subcluster_id']} → "
-        #       f"size: {normalized_sizes[i]:.2f}, "
-        #       f"cohesion: {cohesions[i]:.2f}, "
-        #       f"separation: {separations[i]:.2f}, "
+        #       f"size: {normalized_size:.2f}, "
+        #       f"cohesion: {s['cohesion']:.2f}, "
+        #       f"separation: {s['separation']:.2f}, "
         #       f"final score: {score:.2f}")
 
     return subclusters
@@ -222,15 +304,16 @@ def save_subclusters(top_faq_subclusters, ticket_src):
             "Num_Resolutions", "All_Summaries", "All_Resolutions"
         ])
 
-        for s in top_faq_subclusters:
-            summaries_str = " ||| ".join(s["summaries"])
-            resolutions_str = " ||| ".join(s["resolutions"]) if s["resolutions"] else ""
-
-            writer.writerow([
+        # Build all rows, then write them in one call
+        rows = [
+            [
                 s["cluster"],
                 s["subcluster_id"],
                 len(s["summaries"]),
                 len(s["resolutions"]),
-                summaries_str,
-                resolutions_str
-            ])
\ No newline at end of file
+                " ||| ".join(s["summaries"]),
+                " ||| ".join(s["resolutions"]) if s["resolutions"] else ""
+            ]
+            for s in top_faq_subclusters
+        ]
+        writer.writerows(rows)
\ No newline at end of file
@@ -11,6 +11,11 @@ Purpose:
 # Define global configuration variables
 TICKET_SRC:str = "tdx"  # Set to "tdx" or "anvil" depending on data source
 MODEL_DEVICE:str = "gpu" # e.g. gpu, cpu
+MODEL_NAME:str = "sentence-transformers/all-mpnet-base-v2" # Sentence embedding model (also keys the embedding cache)
+
+# Disk cache for embeddings and subclusters (development only; leave off for production runs)
+USE_CACHE:bool = False
+CACHE_VERSION:int = 1  # Bump after changing clustering code in cluster_helper so stale cache entries are not reused
 
 # Define global variables for ranking subclusters
 MIN_SIZE = 0.05     # Too small = too specific
@@ -38,7 +43,13 @@ def get_model(model_device:str="cuda") -> SentenceTransformer:
         else:
             model_device = "cpu"
 
-    model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2', device=model_device, trust_remote_code=True)
+    model = SentenceTransformer(MODEL_NAME, device=model_device, trust_remote_code=True)
+
+    # Run inference in half precision on GPUs (tensor cores); FP16 on Nvidia, BF16 on Intel
+    if model_device == "cuda":
+        model = model.half()
+    elif model_device == "xpu":
+        model = model.to(torch.bfloat16)
 
     return model
 
@@ -13,9 +13,12 @@ Purpose:
 # -------------------- Load Libraries --------------------
 import pandas as pd                      # DataFrame operations
 import requests                          # API calls to GenAI endpoint
+from requests.adapters import HTTPAdapter         # Connection pooling for concurrent API calls
+from urllib3.util.retry import Retry              # Automatic retry with backoff for API calls
 import re                                # Regular expressions for Q&A parsing
 from dotenv import load_dotenv           # Load API key from environment
 import os                                # For accessing environment variables
+from concurrent.futures import ThreadPoolExecutor  # Concurrent LLM requests
 
 # -------------------- Initial Config --------------------
 # Load environment variables
@@ -24,19 +27,64 @@ GENAI_API_KEY = os.getenv("GENAI_API_KEY")
 GENAI_MODEL = "phi4:latest" 
 GENAI_API_URL = "https://genai.rcac.purdue.edu/api/chat/completions"
 TICKET_SRC = "tdx" # Change to 'anvil' if needed
+NUM_CANDIDATES = 5 # Candidate FAQs sampled per subcluster before merging
+MAX_WORKERS = 8 # Subclusters processed concurrently (requests are I/O-bound, so threads suffice)
+
+# Request headers are the same for every call
+HEADERS = {
+    "Authorization": f"Bearer {GENAI_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# Retry transient failures (rate limits, gateway/server errors, connection and read errors) with exponential backoff;
+# POST must be allowed explicitly since urllib3 only retries idempotent methods by default
+RETRY_POLICY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods={"POST"},
+    raise_on_status=False,
+)
+
+# Share one keep-alive session across threads so TCP/TLS connections are reused between calls
+# (pool sized for every subcluster worker falling back to parallel single requests at once)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=MAX_WORKERS,
+    pool_maxsize=MAX_WORKERS * NUM_CANDIDATES,
+    max_retries=RETRY_POLICY,
+))
+
+# -------------------- Compiled Patterns --------------------
+# Wrap-up phrases removed from FAQ answers
+WRAPUP_PATTERNS = [
+    re.compile(r"(?i)by following these steps.*?[.!]$"),
+    re.compile(r"(?i)this should (fix|resolve).*?[.!]$"),
+]
+# Usernames masked in FAQ answers
+USERNAME_RE = re.compile(r"\b[a-z]{1,10}[0-9]{1,5}\b")
+# First Q/A pair in a candidate FAQ response
+CANDIDATE_RE = re.compile(r"Q:\s?.*?\nA:\s?.*?(?=\nQ:|\Z)", re.DOTALL)
+# (question, answer) pairs in the merged FAQ response
+QA_PAIR_RE = re.compile(r"\*{0,2}Q[:\.]\*{0,2}\s*(.*?)\n\*{0,2}A[:\.]\*{0,2}\s*(.*?)(?=\n\*{0,2}Q[:\.]\*{0,2}|\Z)", re.DOTALL)
 
 # -------------------- Load Input Data --------------------
 df_tickets = pd.read_csv(f"_3_select_tickets/{TICKET_SRC}_top_faq_candidates.csv")
 
-# Parse summaries and resolutions into lists 
-df_tickets['All_Summaries'] = df_tickets['All_Summaries'].apply(lambda x: [s.strip() for s in x.split('|||') if s.strip()])
-df_tickets['All_Resolutions'] = df_tickets['All_Resolutions'].apply(lambda x: [r.strip() for r in x.split('|||') if r.strip()])
+# Parse summaries and resolutions into lists (split and strip in one vectorized regex split; only the empty-entry filter runs per row)
+for col in ['All_Summaries', 'All_Resolutions']:
+    df_tickets[col] = (df_tickets[col].fillna('').str.strip()
+                       .str.split(r'\s*\|\|\|\s*', regex=True)
+                       .apply(lambda entries: [e for e in entries if e]))
 
 
 # -------------------- Prompt Builder --------------------
-# Builds a structure prompt for FAQ generation per subcluster
-def build_faq_prompt(summaries, resolutions, word_limit=2000):
-  header = """
+# Whitespace-separated word count
+def wc(s):
+  return len(s.split())
+
+# Fixed instructions that open every FAQ generation prompt
+FAQ_HEADER = """
 **Role**
 You are an expert assistant tasked with generating FAQs for High-Performance Computing (HPC) systems. You possess deep knowledge of HPC architectures, technical challenges, and troubleshooting methods. Your goal is to create **ONE CONCISE, INFORMATIVE, AND ACTIONABLE FAQ** based on real support scenarios. This FAQ will help users resolve common issues **WITHOUT** submitting a support ticket.
 
@@ -86,14 +134,18 @@ Limit your respone to **NO MORE THAN 200 WORDS**
 
 **Input Data**
 """
-  current_word_count = len(header.split())
+HEADER_WC = len(FAQ_HEADER.split())  # Counted once at import
+
+# Builds a structure prompt for FAQ generation per subcluster
+def build_faq_prompt(summaries, resolutions, word_limit=2000):
+  current_word_count = HEADER_WC
   body_lines = []
 
   # Append each issue/resoultion pair to the prompt body until word limit is reached
   for i, (summary, resolution) in enumerate(zip(summaries, resolutions)):
       issue_text = f"Issue Summary {i+1}: {summary}"
       resolution_text = f"Resolution {i+1}: {resolution}"
-      entry_word_count = len(issue_text.split()) + len(resolution_text.split())
+      entry_word_count = wc(issue_text) + wc(resolution_text)
 
 
       if current_word_count + entry_word_count > word_limit:
@@ -104,7 +156,7 @@ Limit your respone to **NO MORE THAN 200 WORDS**
       body_lines.append("")  # add space between each issue and summary pair
       current_word_count += entry_word_count
 
-  return f"{header}\n" + "\n".join(body_lines)
+  return f"{FAQ_HEADER}\n" + "\n".join(body_lines)
 
 # -------------------- Post-Processing --------------------
 def clean_faq_answer(text):
@@ -112,15 +164,11 @@ def clean_faq_answer(text):
     Additional postprocessing that acts as a safeguard against any username leaks & removes excess wrap-up phrases
     """
     # Remove wrap-up phrases
-    wrapup_patterns = [
-        r"(?i)by following these steps.*?[.!]$",
-        r"(?i)this should (fix|resolve).*?[.!]$",
-    ]
-    for pattern in wrapup_patterns:
-        text = re.sub(pattern, "", text).strip()
+    for pattern in WRAPUP_PATTERNS:
+        text = pattern.sub("", text).strip()
 
     # Mask usernames
-    text = re.sub(r"\b[a-z]{1,10}[0-9]{1,5}\b", "your-username", text)
+    text = USERNAME_RE.sub("your-username", text)
 
     return text
 
@@ -159,10 +207,6 @@ A: [merged answer]
 **Candidate FAQs to merge:**
 """ + "\n\n".join(faq_candidates).strip()
 
-    headers = {
-        "Authorization": f"Bearer " + GENAI_API_KEY,
-        "Content-Type": "application/json"
-    }
     body = {
         "model": GENAI_MODEL,
         "messages": [{"role": "user", "content": merge_prompt}],
@@ -171,30 +215,18 @@ A: [merged answer]
         "stream": False,
     }
 
-    r = requests.post(GENAI_API_URL, headers=headers, json=body)
+    r = SESSION.post(GENAI_API_URL, headers=HEADERS, json=body)
 
     if r.status_code == 200:
         content = r.json()["choices"][0]["message"]["content"]
         print("====== MERGED RESPONSE ======")
         print(content)
 
-        # Pattern to extract questions
-        entries = re.findall(
-        r"\*{0,2}Q[:\.]\*{0,2}\s*(.*?)(?=\n\*{0,2}A[:\.]\*{0,2})",
-        content,
-        re.DOTALL
-        )
-
-        # Pattern to extract answers
-        answers = re.findall(
-        r"\*{0,2}A[:\.]\*{0,2}\s*(.*?)(?=\n\*{0,2}Q[:\.]\*{0,2}|\Z)",
-        content,
-        re.DOTALL
-        )
-
-        if entries and answers:
-            question = entries[0].strip()
-            answer = answers[0].strip()
+        # Extract question/answer pairs in a single scan
+        pairs = QA_PAIR_RE.findall(content)
+
+        if pairs:
+            question, answer = (part.strip() for part in pairs[0])
             answer_cleaned = clean_faq_answer(answer)
             return f"Q: {question}\nA: {answer_cleaned}\n"
         else:
@@ -206,40 +238,61 @@ A: [merged answer]
         print(f"Response: {r.text}")
         return None
 
-# ----------------------- FAQ Generation Loop ------------------------------
-faq_entries = []
-num = min(15, len(df_tickets)) # Only generate up to 15 FAQs
+# ----------------------- Candidate FAQ Generation ------------------------------
+# Requests n sampled completions of the same prompt in a single call (the prompt is only prefilled once)
+def request_faq_candidates(prompt, n):
+    body = {
+        "model": GENAI_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,  
+        "max_tokens": 250, 
+        "stream": False
+    }
+    # Only ask for multiple completions when needed, so single requests match the plain call (some endpoints reject "n")
+    if n > 1:
+        body["n"] = n
+    r = SESSION.post(GENAI_API_URL, headers=HEADERS, json=body)
+    if r.status_code == 200:
+        return [choice["message"]["content"] for choice in r.json()["choices"]]
+    else: 
+        print("❌ Invalid Request")
+        print(r.status_code)
+        return []
+
+# Generates NUM_CANDIDATES candidate FAQs for one prompt
+def generate_candidate_faqs(prompt):
+    contents = request_faq_candidates(prompt, NUM_CANDIDATES)
+
+    # Fall back to parallel single requests if the endpoint ignores or rejects "n"
+    missing = NUM_CANDIDATES - len(contents)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=missing) as ex:
+            for extra in ex.map(request_faq_candidates, [prompt] * missing, [1] * missing):
+                contents.extend(extra)
 
-for i in range(num):
     candidate_faqs = []
-    for _ in range(5):  # Generate 5 candidate FAQs per subcluster 
-        prompt = build_faq_prompt(df_tickets['All_Summaries'][i], df_tickets['All_Resolutions'][i])
-        headers = {
-        "Authorization": f"Bearer {GENAI_API_KEY}",
-        "Content-Type": "application/json"
-        }
-        body = {
-            "model": GENAI_MODEL,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.2,  
-            "max_tokens": 250, 
-            "stream": False
-        }
-        r = requests.post(GENAI_API_URL, headers=headers, json=body)
-        if r.status_code == 200:
-            content = r.json()["choices"][0]["message"]["content"]
-            match = re.search(r"Q:\s?.*?\nA:\s?.*?(?=\nQ:|\Z)", content, re.DOTALL)
-            if match:
-                candidate_faqs.append(match.group(0).strip())
-        else: 
-            print("❌ Invalid Request")
-            print(r.status_code)
+    for content in contents:
+        match = CANDIDATE_RE.search(content)
+        if match:
+            candidate_faqs.append(match.group(0).strip())
+    return candidate_faqs
+
+# ----------------------- FAQ Generation Loop ------------------------------
+# Generates the candidate FAQs for one subcluster and returns their merged FAQ (or None)
+def process_subcluster(i):
+    prompt = build_faq_prompt(df_tickets['All_Summaries'][i], df_tickets['All_Resolutions'][i])
+    candidate_faqs = generate_candidate_faqs(prompt)  # Generate 5 candidate FAQs per subcluster
     #print("======== Candidate FAQs ========")  
     #print(candidate_faqs) 
     if candidate_faqs:
-        merged_faq = merge_faq_candidates(candidate_faqs)
-        if merged_faq:
-            faq_entries.append(merged_faq)
+        return merge_faq_candidates(candidate_faqs)
+    return None
+
+num = min(15, len(df_tickets)) # Only generate up to 15 FAQs
+
+# Subclusters are independent, so their requests run concurrently; ex.map keeps the subcluster order
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+    faq_entries = [faq for faq in ex.map(process_subcluster, range(num)) if faq]
 
 # -------------------- Output Markdown File --------------------
 # Converts raw Q&A pairs into markdown format. 